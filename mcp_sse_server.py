@@ -7,8 +7,14 @@ All rights reserved.
 """
 
 import os
+import asyncio
+import contextlib
+import hmac
+import logging
 import secrets
-import json
+import time
+from collections import OrderedDict
+import orjson
 from typing import Any
 from starlette.applications import Starlette
 from starlette.responses import Response, JSONResponse, StreamingResponse
@@ -17,9 +23,13 @@ from starlette.middleware import Middleware
 from starlette.middleware.cors import CORSMiddleware
 from starlette.requests import Request
 import uvicorn
-from server import app as mcp_server, get_tools_list
+from server import app as mcp_server, get_tools_list, call_tool_internal, init_tools, tools_ready, close_api_client
+
+logging.basicConfig(level=os.getenv("LOG_LEVEL", "WARNING").upper())
+logger = logging.getLogger("wygiwyh")
 
 MCP_TOKEN = os.getenv("MCP_TOKEN", "")
+CORS_ORIGINS = [o.strip() for o in os.getenv("CORS_ORIGINS", "").split(",") if o.strip()]
 
 if not MCP_TOKEN:
     MCP_TOKEN = secrets.token_urlsafe(32)
@@ -28,17 +38,111 @@ if not MCP_TOKEN:
     print(f"Generated temporary token: {MCP_TOKEN}")
     print("Set MCP_TOKEN environment variable")
     print(f"{'='*60}\n")
+    # Worker processes re-import this module; make them share the generated token
+    os.environ["MCP_TOKEN"] = MCP_TOKEN
+
+_MCP_TOKEN_BYTES = MCP_TOKEN.encode()
+_MCP_TOKEN_LEN = len(MCP_TOKEN)
+
+# Recently accepted Authorization headers -> expiry (time.monotonic()).
+# Keyed by the full header rather than its hash so a collision can't authenticate.
+_AUTH_CACHE: OrderedDict[str, float] = OrderedDict()
+_AUTH_CACHE_TTL = 120.0
+_AUTH_CACHE_MAX = 128
+
+_UNAUTHORIZED_BYTES = b'{"error":"Unauthorized"}'
+_UNAUTHORIZED_HEADERS = {"WWW-Authenticate": 'Bearer realm="MCP Server"'}
+
+_INIT_RESULT = {
+    "protocolVersion": "2024-11-05",
+    "capabilities": {
+        "tools": {}
+    },
+    "serverInfo": {
+        "name": "WYGIWYH MCP Server",
+        "version": "1.0.0"
+    }
+}
+# Only the request id varies between initialize responses
+_INIT_RESPONSE_TEMPLATE = (
+    b'{"jsonrpc":"2.0","id":%s,"result":'
+    + orjson.dumps(_INIT_RESULT)
+    + b'}'
+)
+
+_KEEPALIVE = b": keepalive\n\n"
+
+_INIT_FRAME = (
+    b"event: message\ndata: "
+    + orjson.dumps({
+        "jsonrpc": "2.0",
+        "method": "initialize",
+        "params": {
+            "protocolVersion": "2024-11-05",
+            "capabilities": {},
+            "serverInfo": {
+                "name": "WYGIWYH MCP Server",
+                "version": "1.0.0"
+            }
+        }
+    })
+    + b"\n\n"
+)
+
+class ORJSONResponse(JSONResponse):
+    """JSONResponse rendered with orjson."""
+
+    def render(self, content: Any) -> bytes:
+        return orjson.dumps(content)
+
+_STARTING_BYTES = b'{"error":"Server is starting"}'
+
+def unauthorized_response() -> Response:
+    """Build a 401 response from the pre-serialized body."""
+    # A fresh Response per request: middleware may mutate its raw headers
+    return Response(
+        content=_UNAUTHORIZED_BYTES,
+        status_code=401,
+        media_type="application/json",
+        headers=_UNAUTHORIZED_HEADERS
+    )
+
+def validate_bearer_header(auth_header: str) -> bool:
+    """Check an Authorization header against MCP_TOKEN (constant-time compare)."""
+    if auth_header[:7] != "Bearer ":
+        return False
+    token = auth_header[7:]
+    # Cheap format check before touching the secret
+    if len(token) != _MCP_TOKEN_LEN:
+        return False
+    return hmac.compare_digest(token.encode(), _MCP_TOKEN_BYTES)
+
+def starting_response() -> Response:
+    """Build a 503 response for requests that arrive before the tool index is ready."""
+    return Response(
+        content=_STARTING_BYTES,
+        status_code=503,
+        media_type="application/json",
+        headers={"Retry-After": "1"}
+    )
 
 def check_bearer_token(request: Request) -> bool:
-    """Check if Bearer token is valid."""
+    """Check if Bearer token is valid, using a short-lived cache of accepted headers."""
     auth_header = request.headers.get("Authorization", "")
-    if not auth_header.startswith("Bearer "):
-        return False
-    try:
-        token = auth_header.split(" ")[1]
-        return token == MCP_TOKEN
-    except:
+    now = time.monotonic()
+    
+    expiry = _AUTH_CACHE.get(auth_header)
+    if expiry is not None and expiry > now:
+        return True
+    
+    if not validate_bearer_header(auth_header):
         return False
+    
+    _AUTH_CACHE[auth_header] = now + _AUTH_CACHE_TTL
+    _AUTH_CACHE.move_to_end(auth_header)
+    if len(_AUTH_CACHE) > _AUTH_CACHE_MAX:
+        _AUTH_CACHE.popitem(last=False)
+    return True
 
 async def health_check(request: Request):
     """Health check endpoint - no auth required."""
@@ -49,30 +153,22 @@ async def health_check(request: Request):
         "auth": "Bearer token required for MCP endpoints"
     })
 
+async def event_stream():
+    """SSE stream: initialize event, then a keepalive comment every 30s."""
+    yield _INIT_FRAME
+    
+    while True:
+        await asyncio.sleep(30)
+        yield _KEEPALIVE
+
 async def handle_root_get(request: Request):
     """Handle GET requests to root - return SSE stream for initialization."""
     if not check_bearer_token(request):
-        return Response(
-            content='{"error": "Unauthorized"}',
-            status_code=401,
-            media_type="application/json",
-            headers={"WWW-Authenticate": 'Bearer realm="MCP Server"'}
-        )
+        return unauthorized_response()
     
-    print(f"SSE connection from {request.client}")
+    logger.info("SSE connection from %s", request.client)
     
     # Return SSE stream with server info
-    async def event_stream():
-        # Send initialize event
-        yield f"event: message\n"
-        yield f"data: {json.dumps({'jsonrpc': '2.0', 'method': 'initialize', 'params': {'protocolVersion': '2024-11-05', 'capabilities': {}, 'serverInfo': {'name': 'WYGIWYH MCP Server', 'version': '1.0.0'}}})}\n\n"
-        
-        # Keep connection alive
-        import asyncio
-        while True:
-            await asyncio.sleep(30)
-            yield f": keepalive\n\n"
-    
     return StreamingResponse(
         event_stream(),
         media_type="text/event-stream",
@@ -86,49 +182,47 @@ async def handle_root_get(request: Request):
 async def handle_root_post(request: Request):
     """Handle POST requests to root - execute MCP methods."""
     if not check_bearer_token(request):
-        return Response(
-            content='{"error": "Unauthorized"}',
-            status_code=401,
-            media_type="application/json",
-            headers={"WWW-Authenticate": 'Bearer realm="MCP Server"'}
-        )
+        return unauthorized_response()
+    if not tools_ready():
+        return starting_response()
+    
+    try:
+        body = orjson.loads(await request.body())
+    except orjson.JSONDecodeError as e:
+        return ORJSONResponse({
+            "jsonrpc": "2.0",
+            "id": None,
+            "error": {
+                "code": -32700,
+                "message": f"Parse error: {e}"
+            }
+        }, status_code=400)
     
+    request_id = None
     try:
-        body = await request.json()
-        print(f"Received JSON-RPC request: {body.get('method', 'unknown')}")
+        logger.info("Received JSON-RPC request: %s", body.get("method", "unknown"))
         
-        method = body.get("method")
-        params = body.get("params", {})
         request_id = body.get("id")
+        method = body.get("method")
         
         # Handle notifications (no id, no response needed)
         if request_id is None:
-            print(f"Notification received: {method}")
+            logger.info("Notification received: %s", method)
             # Notifications don't get a response, just return 200
             return Response(status_code=200)
         
         # Handle different MCP methods
         if method == "initialize":
-            result = {
-                "protocolVersion": "2024-11-05",
-                "capabilities": {
-                    "tools": {}
-                },
-                "serverInfo": {
-                    "name": "WYGIWYH MCP Server",
-                    "version": "1.0.0"
-                }
-            }
-            return JSONResponse({
-                "jsonrpc": "2.0",
-                "id": request_id,
-                "result": result
-            })
+            return Response(
+                content=_INIT_RESPONSE_TEMPLATE % orjson.dumps(request_id),
+                status_code=200,
+                media_type="application/json"
+            )
         
         elif method == "tools/list":
             # Get tools from the MCP server
             tools_list = await get_tools_list()
-            return JSONResponse({
+            return ORJSONResponse({
                 "jsonrpc": "2.0",
                 "id": request_id,
                 "result": {
@@ -137,31 +231,32 @@ async def handle_root_post(request: Request):
             })
         
         elif method == "tools/call":
-            # Call a tool
+            # Call a tool; params are only needed on this branch
+            params = body.get("params", {})
             tool_name = params.get("name")
             tool_args = params.get("arguments", {})
             
-            print(f"Calling tool: {tool_name} with args: {tool_args}")
+            logger.info("Calling tool: %s", tool_name)
+            logger.debug("Tool %s args: %s", tool_name, tool_args)
             
             # Call the tool using the MCP server
-            from server import call_tool_internal
             result = await call_tool_internal(tool_name, tool_args)
             
-            return JSONResponse({
+            return ORJSONResponse({
                 "jsonrpc": "2.0",
                 "id": request_id,
                 "result": {
                     "content": [
                         {
                             "type": "text",
-                            "text": json.dumps(result)
+                            "text": orjson.dumps(result).decode()
                         }
                     ]
                 }
             })
         
         else:
-            return JSONResponse({
+            return ORJSONResponse({
                 "jsonrpc": "2.0",
                 "id": request_id,
                 "error": {
@@ -171,20 +266,11 @@ async def handle_root_post(request: Request):
             }, status_code=400)
     
     except Exception as e:
-        print(f"Error handling request: {e}")
-        import traceback
-        traceback.print_exc()
-        
-        error_request_id = None
-        try:
-            body_dict = await request.json()
-            error_request_id = body_dict.get("id")
-        except:
-            pass
+        logger.exception("Error handling request: %s", e)
         
-        return JSONResponse({
+        return ORJSONResponse({
             "jsonrpc": "2.0",
-            "id": error_request_id,
+            "id": request_id,
             "error": {
                 "code": -32603,
                 "message": f"Internal error: {str(e)}"
@@ -197,17 +283,24 @@ routes = [
     Route("/health", health_check, methods=["GET"]),
 ]
 
+# n8n calls server-to-server, so CORS is only enabled for explicitly listed browser origins
 middleware = [
     Middleware(
         CORSMiddleware,
-        allow_origins=["*"],
-        allow_credentials=True,
-        allow_methods=["*"],
-        allow_headers=["*"],
+        allow_origins=CORS_ORIGINS,
+        allow_credentials=False,
+        allow_methods=["GET", "POST"],
+        allow_headers=["Authorization", "Content-Type"],
     ),
-]
+] if CORS_ORIGINS else []
 
-app = Starlette(routes=routes, middleware=middleware)
+@contextlib.asynccontextmanager
+async def lifespan(app: Starlette):
+    await init_tools()
+    yield
+    await close_api_client()
+
+app = Starlette(routes=routes, middleware=middleware, lifespan=lifespan)
 
 if __name__ == "__main__":
     print("\n" + "="*60)
@@ -224,9 +317,15 @@ if __name__ == "__main__":
     print("  Additional Headers: Authorization:Bearer " + MCP_TOKEN)
     print("="*60 + "\n")
     
+    workers = int(os.getenv("WORKERS", "1"))
+    
     uvicorn.run(
-        app,
+        # uvicorn can only spawn multiple workers from an import string
+        app if workers == 1 else "mcp_sse_server:app",
         host="0.0.0.0",
         port=5000,
-        log_level="info"
+        loop="uvloop",
+        http="httptools",
+        log_level="warning",
+        workers=workers
     )
@@ -8,11 +8,13 @@ All rights reserved.
 """
 
 import os
-import json
+import re
 import base64
+from dataclasses import dataclass
 from typing import Any
 import yaml
 import httpx
+import orjson
 from mcp.server import Server
 from mcp.types import Tool, TextContent
 from pydantic import AnyUrl
@@ -20,31 +22,50 @@ import asyncio
 
 API_BASE_URL = "https://your-WYGIWYH.com"
 
-def get_auth_header() -> str:
-    """Get the current Basic auth header from environment variables."""
-    api_username = os.getenv("API_USERNAME", "")
-    api_password = os.getenv("API_PASSWORD", "")
-    
+_TITLE_RE = re.compile(rb'<title>(.*?)</title>', re.IGNORECASE)
+
+_METHODS = frozenset({"get", "post", "put", "patch", "delete"})
+
+def build_auth_header(api_username: str, api_password: str) -> str:
+    """Build the Basic auth header value, or "" if credentials are missing."""
     if api_username and api_password:
-        return base64.b64encode(f"{api_username}:{api_password}".encode()).decode()
+        return "Basic " + base64.b64encode(f"{api_username}:{api_password}".encode()).decode()
     return ""
 
-with open("attached_assets/WYGIWYH API (1)_1759581638933.yaml", "r", encoding="utf-8") as f:
-    openapi_spec = yaml.safe_load(f)
+# Credentials are fixed for the lifetime of the process
+_AUTH_HEADER = build_auth_header(os.getenv("API_USERNAME", ""), os.getenv("API_PASSWORD", ""))
+
+# Shared per-request header sets; httpx copies them, so they are never mutated
+_BASE_HEADERS = {"Authorization": _AUTH_HEADER, "Accept": "application/json"}
+_JSON_HEADERS = {**_BASE_HEADERS, "Content-Type": "application/json"}
+
+OPENAPI_SPEC_PATH = "attached_assets/WYGIWYH API (1)_1759581638933.yaml"
+
+def load_openapi_spec(path: str = OPENAPI_SPEC_PATH) -> dict:
+    """Read and parse the OpenAPI specification (blocking)."""
+    with open(path, "r", encoding="utf-8") as f:
+        return yaml.load(f, Loader=getattr(yaml, "CSafeLoader", yaml.SafeLoader))
+
+# Populated by init_tools() before the server starts handling requests
+openapi_spec: dict = {}
 
 app = Server("wygiwyh-api-server")
 
+# Shared client so upstream connections are pooled and kept alive between tool calls
+_client = httpx.AsyncClient(
+    base_url=API_BASE_URL,
+    timeout=30.0,
+    http2=True,
+    limits=httpx.Limits(max_keepalive_connections=32, max_connections=64)
+)
+
+async def close_api_client():
+    """Close the shared upstream API client."""
+    await _client.aclose()
+
 async def get_tools_list():
     """Get list of all tools (for HTTP transport)."""
-    tools = generate_tools_from_openapi(openapi_spec)
-    return [
-        {
-            "name": tool.name,
-            "description": tool.description,
-            "inputSchema": tool.inputSchema
-        }
-        for tool in tools
-    ]
+    return _TOOLS_DICT
 
 async def call_tool_internal(name: str, arguments: dict):
     """Call a tool directly (for HTTP transport)."""
@@ -61,6 +82,9 @@ async def call_tool_internal(name: str, arguments: dict):
         return {"text": str(result)}
     return {"error": "No response from tool"}
 
+# Converted component schemas keyed by "$ref"; reset per spec in generate_tools_from_openapi
+_schema_cache: dict[str, dict] = {}
+
 def convert_openapi_to_json_schema(schema: dict, components: dict) -> dict:
     """Convert OpenAPI schema to JSON Schema format for MCP tools."""
     if not schema:
@@ -69,23 +93,27 @@ def convert_openapi_to_json_schema(schema: dict, components: dict) -> dict:
     result = {}
     
     if "$ref" in schema:
-        ref_path = schema["$ref"].split("/")
+        ref = schema["$ref"]
+        if ref in _schema_cache:
+            return _schema_cache[ref]
+        ref_path = ref.split("/")
         if ref_path[0] == "#" and ref_path[1] == "components" and ref_path[2] == "schemas":
             schema_name = ref_path[3]
             if schema_name in components.get("schemas", {}):
-                return convert_openapi_to_json_schema(components["schemas"][schema_name], components)
+                converted = convert_openapi_to_json_schema(components["schemas"][schema_name], components)
+                _schema_cache[ref] = converted
+                return converted
     
     if "allOf" in schema:
         merged_properties = {}
-        merged_required = []
+        merged_required: set[str] = set()
         merged_type = None
         
         for sub_schema in schema["allOf"]:
             converted = convert_openapi_to_json_schema(sub_schema, components)
             if "properties" in converted:
                 merged_properties.update(converted["properties"])
-            if "required" in converted:
-                merged_required.extend(converted["required"])
+            merged_required.update(converted.get("required", ()))
             if "type" in converted and not merged_type:
                 merged_type = converted["type"]
         
@@ -93,7 +121,7 @@ def convert_openapi_to_json_schema(schema: dict, components: dict) -> dict:
         if merged_properties:
             result["properties"] = merged_properties
         if merged_required:
-            result["required"] = list(set(merged_required))
+            result["required"] = list(merged_required)
         
         return result
     
@@ -123,206 +151,214 @@ def generate_tools_from_openapi(spec: dict) -> list[Tool]:
     tools = []
     paths = spec.get("paths", {})
     components = spec.get("components", {})
+    _convert = convert_openapi_to_json_schema
+    _schema_cache.clear()
     
     for path, path_item in paths.items():
         for method, operation in path_item.items():
-            if method.upper() not in ["GET", "POST", "PUT", "PATCH", "DELETE"]:
+            if method.lower() not in _METHODS:
                 continue
             
             operation_id = operation.get("operationId", f"{method}_{path}")
             description = operation.get("description", operation.get("summary", f"{method.upper()} {path}"))
             
+            properties = {}
+            required = []
             input_schema = {
                 "type": "object",
-                "properties": {},
-                "required": []
+                "properties": properties,
+                "required": required
             }
             
-            if "parameters" in operation:
-                for param in operation["parameters"]:
-                    param_name = param["name"]
-                    param_schema = convert_openapi_to_json_schema(param.get("schema", {"type": "string"}), components)
-                    param_schema["description"] = param.get("description", "")
-                    
-                    if param["in"] == "path":
-                        param_name = f"path_{param_name}"
-                    elif param["in"] == "query":
-                        param_name = f"query_{param_name}"
-                    
-                    input_schema["properties"][param_name] = param_schema
-                    
-                    if param.get("required", False):
-                        input_schema["required"].append(param_name)
+            for param in operation.get("parameters") or ():
+                param_name = param["name"]
+                param_in = param["in"]
+                # Copy: converted $ref schemas are cached and shared
+                param_schema = dict(_convert(param.get("schema", {"type": "string"}), components))
+                param_schema["description"] = param.get("description", "")
+                
+                if param_in == "path":
+                    param_name = f"path_{param_name}"
+                elif param_in == "query":
+                    param_name = f"query_{param_name}"
+                
+                properties[param_name] = param_schema
+                
+                if param.get("required", False):
+                    required.append(param_name)
             
-            if "requestBody" in operation:
-                req_body = operation["requestBody"]
+            req_body = operation.get("requestBody")
+            if req_body is not None:
                 content = req_body.get("content", {})
                 
                 body_schema = None
-                preferred_content_type = None
-                for content_type in ["application/json", "application/x-www-form-urlencoded", "multipart/form-data", "text/plain"]:
+                for content_type in ("application/json", "application/x-www-form-urlencoded", "multipart/form-data", "text/plain"):
                     if content_type in content:
                         body_schema = content[content_type].get("schema", {})
-                        preferred_content_type = content_type
                         break
                 
                 if body_schema:
-                    converted_schema = convert_openapi_to_json_schema(body_schema, components)
+                    converted_schema = _convert(body_schema, components)
                     
-                    if "properties" in converted_schema:
-                        for prop_name, prop_schema in converted_schema["properties"].items():
-                            input_schema["properties"][f"body_{prop_name}"] = prop_schema
+                    body_properties = converted_schema.get("properties")
+                    if body_properties is not None:
+                        for prop_name, prop_schema in body_properties.items():
+                            properties[f"body_{prop_name}"] = prop_schema
                         
-                        if "required" in converted_schema:
-                            for req_field in converted_schema["required"]:
-                                input_schema["required"].append(f"body_{req_field}")
+                        required.extend(f"body_{req_field}" for req_field in converted_schema.get("required", ()))
             
-            tool = Tool(
+            tools.append(Tool(
                 name=operation_id,
                 description=description[:1024],
                 inputSchema=input_schema
-            )
-            
-            tools.append(tool)
+            ))
     
     return tools
 
+@dataclass(slots=True)
+class OpRecord:
+    """Everything call_tool needs to dispatch one OpenAPI operation."""
+    path: str
+    method: str
+    operation: dict
+    path_param_names: tuple[str, ...]
+    has_body: bool
+
+def build_op_index(spec: dict) -> dict[str, OpRecord]:
+    """Map each tool name to its dispatch record in the OpenAPI specification."""
+    index = {}
+    for path, path_item in spec.get("paths", {}).items():
+        for method, operation in path_item.items():
+            if method.lower() not in _METHODS:
+                continue
+            operation_id = operation.get("operationId", f"{method}_{path}")
+            if operation_id in index:
+                continue
+            index[operation_id] = OpRecord(
+                path=path,
+                method=method.upper(),
+                operation=operation,
+                path_param_names=tuple(p["name"] for p in operation.get("parameters", []) if p["in"] == "path"),
+                has_body="requestBody" in operation
+            )
+    return index
+
+_TOOLS: list[Tool] = []
+_TOOLS_DICT: list[dict] = []
+_OP_INDEX: dict[str, OpRecord] = {}
+_tools_ready = False
+
+def tools_ready() -> bool:
+    """Whether the spec has been loaded and the tool index built."""
+    return _tools_ready
+
+async def init_tools():
+    """Load the spec off the event loop and build the tool list and operation index once."""
+    global openapi_spec, _TOOLS, _TOOLS_DICT, _OP_INDEX, _tools_ready
+    
+    spec = await asyncio.to_thread(load_openapi_spec)
+    tools = generate_tools_from_openapi(spec)
+    
+    openapi_spec = spec
+    _TOOLS = tools
+    _TOOLS_DICT = [
+        {
+            "name": tool.name,
+            "description": tool.description,
+            "inputSchema": tool.inputSchema
+        }
+        for tool in tools
+    ]
+    _OP_INDEX = build_op_index(spec)
+    _tools_ready = True
+
 @app.list_tools()
 async def list_tools() -> list[Tool]:
     """List all available API tools."""
-    return generate_tools_from_openapi(openapi_spec)
+    return _TOOLS
 
 @app.call_tool()
 async def call_tool(name: str, arguments: dict) -> list[TextContent]:
     """Execute API calls based on tool name and arguments."""
     
-    auth_header = get_auth_header()
-    if not auth_header:
+    if not _AUTH_HEADER:
         return [TextContent(
             type="text",
             text="Error: API_USERNAME and API_PASSWORD environment variables must be set to make API calls"
         )]
     
-    paths = openapi_spec.get("paths", {})
-    
-    path = None
-    method = None
-    operation = None
-    
-    for api_path, path_item in paths.items():
-        for http_method, op in path_item.items():
-            if http_method.upper() not in ["GET", "POST", "PUT", "PATCH", "DELETE"]:
-                continue
-            if op.get("operationId") == name:
-                path = api_path
-                method = http_method.upper()
-                operation = op
-                break
-        if path:
-            break
-    
-    if not path or not method:
+    rec = _OP_INDEX.get(name)
+    if rec is None:
         return [TextContent(
             type="text",
             text=f"Error: Tool '{name}' not found in API specification"
         )]
     
-    path_params = {}
-    query_params = {}
-    body_data = {}
-    
+    buckets = {"path": {}, "query": {}, "body": {}}
     for key, value in arguments.items():
-        if key.startswith("path_"):
-            path_params[key[5:]] = value
-        elif key.startswith("query_"):
-            query_params[key[6:]] = value
-        elif key.startswith("body_"):
-            body_data[key[5:]] = value
-    
-    url = path
-    for param_name, param_value in path_params.items():
-        url = url.replace(f"{{{param_name}}}", str(param_value))
+        prefix, _, rest = key.partition("_")
+        bucket = buckets.get(prefix)
+        if bucket is not None:
+            bucket[rest] = value
+    path_params, query_params, body_data = buckets["path"], buckets["query"], buckets["body"]
     
-    full_url = f"{API_BASE_URL}{url}"
+    try:
+        url = rec.path.format_map({n: str(path_params[n]) for n in rec.path_param_names})
+    except KeyError as e:
+        return [TextContent(
+            type="text",
+            text=f"Error: Missing path parameter 'path_{e.args[0]}'"
+        )]
     
-    headers = {
-        "Authorization": f"Basic {auth_header}",
-        "Accept": "application/json"
-    }
+    json_payload = body_data if body_data and rec.has_body else None
+    headers = _JSON_HEADERS if json_payload else _BASE_HEADERS
     
     try:
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            if method == "GET":
-                response = await client.get(full_url, headers=headers, params=query_params)
-            elif method == "POST":
-                if body_data:
-                    headers["Content-Type"] = "application/json"
-                    response = await client.post(full_url, headers=headers, params=query_params, json=body_data)
-                else:
-                    response = await client.post(full_url, headers=headers, params=query_params)
-            elif method == "PUT":
-                if body_data:
-                    headers["Content-Type"] = "application/json"
-                    response = await client.put(full_url, headers=headers, params=query_params, json=body_data)
+        response = await _client.request(rec.method, url, headers=headers, params=query_params, json=json_payload)
+        
+        status_code = response.status_code
+        
+        if status_code == 204:
+            result = {"status": "success", "message": "Resource deleted or no content returned"}
+        elif 200 <= status_code < 300:
+            try:
+                result = orjson.loads(response.content)
+            except:
+                content_type = response.headers.get("content-type", "")
+                if "text/html" in content_type:
+                    result = {
+                        "status": "success",
+                        "content_type": content_type,
+                        "message": "Response received (HTML content)",
+                        "text_preview": response.text[:500]
+                    }
                 else:
-                    response = await client.put(full_url, headers=headers, params=query_params)
-            elif method == "PATCH":
-                if body_data:
-                    headers["Content-Type"] = "application/json"
-                    response = await client.patch(full_url, headers=headers, params=query_params, json=body_data)
+                    result = {"response": response.text}
+        else:
+            # Non-2xx is handled inline rather than via raise_for_status()
+            error_detail = ""
+            try:
+                error_json = orjson.loads(response.content)
+                error_detail = orjson.dumps(error_json, option=orjson.OPT_INDENT_2).decode()
+            except:
+                content_type = response.headers.get("content-type", "")
+                if "text/html" in content_type:
+                    error_detail = f"HTML Error Page (status {status_code})"
+                    if response.content:
+                        title_match = _TITLE_RE.search(response.content)
+                        if title_match:
+                            error_detail += f"\nTitle: {title_match.group(1).decode('utf-8', 'replace')}"
                 else:
-                    response = await client.patch(full_url, headers=headers, params=query_params)
-            elif method == "DELETE":
-                response = await client.delete(full_url, headers=headers, params=query_params)
-            else:
-                return [TextContent(type="text", text=f"Error: Unsupported HTTP method: {method}")]
-            
-            response.raise_for_status()
-            
-            if response.status_code == 204:
-                result = {"status": "success", "message": "Resource deleted or no content returned"}
-            else:
-                try:
-                    result = response.json()
-                except:
-                    content_type = response.headers.get("content-type", "")
-                    if "text/html" in content_type:
-                        result = {
-                            "status": "success",
-                            "content_type": content_type,
-                            "message": "Response received (HTML content)",
-                            "text_preview": response.text[:500]
-                        }
-                    else:
-                        result = {"response": response.text}
+                    error_detail = response.text[:500]
             
             return [TextContent(
                 type="text",
-                text=json.dumps(result, indent=2, ensure_ascii=False)
+                text=f"HTTP Error {status_code}:\n{error_detail}"
             )]
-    
-    except httpx.HTTPStatusError as e:
-        error_detail = ""
-        status_code = e.response.status_code
-        
-        try:
-            error_json = e.response.json()
-            error_detail = json.dumps(error_json, indent=2)
-        except:
-            content_type = e.response.headers.get("content-type", "")
-            if "text/html" in content_type:
-                error_detail = f"HTML Error Page (status {status_code})"
-                if e.response.text:
-                    import re
-                    title_match = re.search(r'<title>(.*?)</title>', e.response.text, re.IGNORECASE)
-                    if title_match:
-                        error_detail += f"\nTitle: {title_match.group(1)}"
-            else:
-                error_detail = e.response.text[:500]
         
         return [TextContent(
             type="text",
-            text=f"HTTP Error {status_code}:\n{error_detail}"
+            text=orjson.dumps(result, option=orjson.OPT_INDENT_2).decode()
         )]
     
     except Exception as e:
@@ -334,12 +370,17 @@ async def call_tool(name: str, arguments: dict) -> list[TextContent]:
 async def main():
     from mcp.server.stdio import stdio_server
     
-    async with stdio_server() as (read_stream, write_stream):
-        await app.run(
-            read_stream,
-            write_stream,
-            app.create_initialization_options()
-        )
+    await init_tools()
+    
+    try:
+        async with stdio_server() as (read_stream, write_stream):
+            await app.run(
+                read_stream,
+                write_stream,
+                app.create_initialization_options()
+            )
+    finally:
+        await close_api_client()
 
 if __name__ == "__main__":
     asyncio.run(main())